@@ -2,19 +2,22 @@
 import os
 import json
 import sys
+import time
+import shutil
+import zipfile
 import datetime
+import threading
+import concurrent.futures
 import requests
-import simpleaudio
+from requests.adapters import HTTPAdapter, Retry
 import PySimpleGUI as sg
-from psgtray import SystemTray
-if sys.platform != "win32":
-    try:
-        from bidi.algorithm import get_display
-        import arabic_reshaper
-        MISSING_ARABIC_MODULES = False
-    except ImportError:
-        MISSING_ARABIC_MODULES = True
-        print("[DEBUG] Couldn't load Arabic text modules, Install arabic text modules to display text correctly")
+try:
+    import orjson
+except ImportError:
+    orjson = None
+# simpleaudio, psgtray and the arabic text modules are imported lazily at
+# first use to cut down application startup time
+MISSING_ARABIC_MODULES = None
 
 # ------------------------------------- Application Settings ------------------------------------- #
 DATA_DIR = os.path.join(os.path.abspath(__file__).split("athany.py")[0],
@@ -26,16 +29,29 @@ if not os.path.exists(DATA_DIR):
 if not os.path.exists(ATHANS_DIR):
     os.mkdir(ATHANS_DIR)
 
+# athans already on disk, kept up to date as new athans get downloaded
+# so the directory isn't re-scanned on every dropdown selection
+DOWNLOADED_ATHANS = set(os.listdir(ATHANS_DIR))
+
 sg.theme("DarkAmber")
 sg.user_settings_filename(filename='athany-config.json')
-if not sg.user_settings_get_entry('-athan_sound-') or sg.user_settings_get_entry('-athan_sound-') not in os.listdir(ATHANS_DIR):
+if not sg.user_settings_get_entry('-athan_sound-') or sg.user_settings_get_entry('-athan_sound-') not in DOWNLOADED_ATHANS:
     sg.user_settings_set_entry('-athan_sound-', value='Default.wav')
 if not sg.user_settings_get_entry('-mute-athan-'):
     sg.user_settings_set_entry('-mute-athan-', value=False)
 
 UPCOMING_PRAYERS = []
+MONTH_CACHE = {}
 save_loc_check = False
+settings_window = None
+location_coords = None
 API_ENDPOINT = "https://api.aladhan.com/v1/calendarByCity"
+COORDS_API_ENDPOINT = "https://api.aladhan.com/v1/calendar"
+# one session for all http calls, reuses pooled connections instead of
+# paying the tcp+tls handshake on every request to the same host
+SESSION = requests.Session()
+SESSION.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=8,
+                                      max_retries=Retry(total=3, backoff_factor=0.3)))
 FUROOD_NAMES = ["Fajr", "Dhuhr", "Asr", "Maghrib", "Isha"]
 with open(os.path.join(DATA_DIR, 'available_adhans.txt')) as adhans:
     AVAILABLE_ADHANS = adhans.read().strip().split('\n')
@@ -45,24 +61,85 @@ BUTTON_FONT = "Segoe\ UI 10"
 ARABIC_FONT = "Segoe\ UI 12" if sys.platform != "win32" else "Arabic\ Typesetting 20"
 
 
-with open(os.path.join(DATA_DIR, "app_icon.dat"), mode='rb') as icon:
-    APP_ICON = icon.read()
-with open(os.path.join(DATA_DIR, 'download.dat'), mode="rb") as down:
-    DOWNLOAD_ICON_B64 = down.read()
-with open(os.path.join(DATA_DIR, "toggle_off.dat"), mode='rb') as toff:
-    TOGGLE_OFF_B64 = toff.read()
-with open(os.path.join(DATA_DIR, "toggle_on.dat"), mode='rb') as ton:
-    TOGGLE_ON_B64 = ton.read()
+# all icon assets live in one archive, so startup opens a single file
+# instead of four separate ones
+with zipfile.ZipFile(os.path.join(DATA_DIR, "assets.zip")) as assets:
+    APP_ICON = assets.read("app_icon.dat")
+    DOWNLOAD_ICON_B64 = assets.read("download.dat")
+    TOGGLE_OFF_B64 = assets.read("toggle_off.dat")
+    TOGGLE_ON_B64 = assets.read("toggle_on.dat")
 
 
 # ------------------------------------- Main Application logic ------------------------------------- #
 
 
+PENDING_SETTINGS = {}
+SETTINGS_LOCK = threading.Lock()
+SETTINGS_DIRTY = threading.Event()
+SETTINGS_WRITER_SHUTDOWN = threading.Event()
+
+
+def queue_settings_write(key: str, value) -> None:
+    """queue a settings mutation for the background writer thread so the UI
+    doesn't block on the json file write, in-memory settings are updated
+    immediately so reads stay fresh
+    :param key: (str) settings entry key
+    :param value: (Any) value to save for the settings entry
+    """
+    sg.user_settings_object().dict[key] = value
+    with SETTINGS_LOCK:
+        PENDING_SETTINGS[key] = value
+    SETTINGS_DIRTY.set()
+
+
+def flush_settings_writes() -> None:
+    """commit any queued settings writes to the settings file"""
+    with SETTINGS_LOCK:
+        pending = dict(PENDING_SETTINGS)
+        PENDING_SETTINGS.clear()
+        SETTINGS_DIRTY.clear()
+    for key, value in pending.items():
+        sg.user_settings_set_entry(key, value=value)
+
+
+def settings_writer_thread() -> None:
+    """background thread that coalesces settings writes arriving within
+    a 250ms window into a single file save"""
+    while not SETTINGS_WRITER_SHUTDOWN.is_set():
+        SETTINGS_DIRTY.wait()
+        if SETTINGS_WRITER_SHUTDOWN.is_set():
+            break
+        time.sleep(0.25)
+        flush_settings_writes()
+
+
+def stop_settings_writer() -> None:
+    """stop and join the background writer so only the calling thread
+    touches the settings file from this point on"""
+    SETTINGS_WRITER_SHUTDOWN.set()
+    SETTINGS_DIRTY.set()  # wake the writer if it's waiting so it can exit
+    SETTINGS_WRITER.join()
+
+
+SETTINGS_WRITER = threading.Thread(target=settings_writer_thread, daemon=True)
+SETTINGS_WRITER.start()
+
+
 def display_ar_text(text: str) -> str:
     """
     :param text: (str) arabic text to display correctly
     :return: (str) correctly formatted arabic string
     """
+    global MISSING_ARABIC_MODULES, get_display, arabic_reshaper
+    if sys.platform != 'win32' and MISSING_ARABIC_MODULES is None:
+        try:
+            from bidi.algorithm import get_display
+            import arabic_reshaper
+            MISSING_ARABIC_MODULES = False
+        except ImportError:
+            MISSING_ARABIC_MODULES = True
+            print("[DEBUG] Couldn't load Arabic text modules, Install arabic text modules to display text correctly")
+
     if sys.platform != 'win32' and not MISSING_ARABIC_MODULES:
         ar_txt = arabic_reshaper.reshape(text)
         bidi_txt = get_display(ar_txt)
@@ -81,15 +158,39 @@ def GraphicButton(text, key, image_b64, pad=(0, 0)):
     return sg.Button(text, image_source=image_b64, button_color=(sg.theme_background_color(), sg.theme_background_color()), font=BUTTON_FONT, pad=pad, key=key, border_width=0)
 
 
+class DownloadProgressWriter:
+    """file-like wrapper that counts the bytes streamed into the athan file
+    and refreshes the download progress window at most every 100ms
+    """
+
+    def __init__(self, fileobj, prog_win):
+        self.fileobj = fileobj
+        self.prog_win = prog_win
+        self.written = 0
+        self.last_ui = time.monotonic()
+
+    def write(self, chunk):
+        self.fileobj.write(chunk)
+        self.written += len(chunk)
+        if time.monotonic() - self.last_ui >= 0.1:
+            self.last_ui = time.monotonic()
+            prog_e, prog_v = self.prog_win.read(timeout=10)
+            if prog_e in (sg.WIN_CLOSE_ATTEMPTED_EVENT, 'Cancel'):
+                raise Exception("download cancelled")
+            self.prog_win['-PROGRESS-METER-'].update(
+                current_count=self.written)
+
+
 def download_athan(athan_filename: str) -> bool:
     """Function to download athans from app directory on archive.org
     :param athan_filename: (str) name of .wav file to download from archive.org
     :return: (bool) True if the download completed successfully without errors, False otherwise
     """
+    prog_win = None
     try:
         saved_file = os.path.join(ATHANS_DIR, athan_filename)
-        file_data = requests.get("https://archive.org/download/athany-data/"+athan_filename,
-                                 stream=True)
+        file_data = SESSION.get("https://archive.org/download/athany-data/"+athan_filename,
+                                stream=True)
         file_size = int(file_data.headers.get('content-length'))
 
         progress_layout = [[sg.Text(f"Downloading {athan_filename} ({file_size//1024} KB) from archive...")],
@@ -99,36 +200,42 @@ def download_athan(athan_filename: str) -> bool:
 
         prog_win = sg.Window("Download athan",
                              progress_layout, keep_on_top=True, icon=DOWNLOAD_ICON_B64, enable_close_attempted_event=True)
-        dl = 0
-        with open(saved_file, "wb") as athan_file:
 
-            for chunk in file_data.iter_content(chunk_size=4096):
-                dl += len(chunk)
-                athan_file.write(chunk)
-
-                prog_e, prog_v = prog_win.read(timeout=10)
-                if prog_e in (sg.WIN_CLOSE_ATTEMPTED_EVENT, 'Cancel'):
-                    prog_win.close()
-                    del prog_win
-                    raise Exception
-                prog_win['-PROGRESS-METER-'].update(current_count=dl)
+        # hand the raw response stream straight to copyfileobj, skipping
+        # requests' per-chunk decoding layer in iter_content
+        file_data.raw.decode_content = True
+        with open(saved_file, "wb") as athan_file:
+            shutil.copyfileobj(file_data.raw,
+                               DownloadProgressWriter(athan_file, prog_win),
+                               length=1024*1024)
 
-            prog_win.close()
-            del prog_win
+        prog_win.close()
+        del prog_win
 
         return True
     except:
+        if prog_win is not None:
+            prog_win.close()
         os.remove(saved_file)
         return False
 
 
-def play_selected_athan() -> simpleaudio.PlayObject:
+WAVE_CACHE = {}
+
+
+def play_selected_athan() -> "simpleaudio.PlayObject":
     """ fetches current settings for athan and plays the corresponding athan
     :return: (simpleaudio.PlayObject) play object to control playback of athan
     """
-    current_athan_path = os.path.join(
-        ATHANS_DIR, sg.user_settings_get_entry('-athan_sound-'))
-    wave_obj = simpleaudio.WaveObject.from_wave_file(current_athan_path)
+    import simpleaudio
+    current_athan = sg.user_settings_get_entry('-athan_sound-')
+    # reuse the decoded WaveObject so the wav file isn't re-read and
+    # re-parsed right before playback every prayer
+    wave_obj = WAVE_CACHE.get(current_athan)
+    if wave_obj is None:
+        wave_obj = simpleaudio.WaveObject.from_wave_file(
+            os.path.join(ATHANS_DIR, current_athan))
+        WAVE_CACHE[current_athan] = wave_obj
     play_obj = wave_obj.play()
     return play_obj
 
@@ -137,14 +244,18 @@ def get_current_location() -> tuple[str, str] | str:
     """ function that gets the current city and country of the user IP\n
     :return: (Tuple[str, str]) tuple containing 2 strings of the city & country fetched
     """
+    global location_coords
     try:
-        IP_city = requests.get("https://ipinfo.io/city",
-                               timeout=100).text.strip()
-        IP_country = requests.get("https://ipinfo.io/country",
-                                  timeout=100).text.strip()
-        print("[DEBUG]", IP_city, IP_country)
-        return (IP_city, IP_country)
-    except:
+        # one /json request returns both fields instead of two separate calls
+        IP_info = SESSION.get("https://ipinfo.io/json",
+                              timeout=5).json()
+        # remember the "lat,lon" pair so prayer times can be requested by
+        # coordinates directly instead of geocoding the city on the api side
+        if IP_info.get("loc"):
+            location_coords = IP_info["loc"].split(",")
+        print("[DEBUG]", IP_info["city"], IP_info["country"])
+        return (IP_info["city"], IP_info["country"])
+    except (requests.RequestException, KeyError, ValueError):
         return "RequestError"
 
 
@@ -155,24 +266,43 @@ def fetch_calender_data(cit: str, count: str, date: datetime.datetime) -> dict:
     :param date: (datetime.datetime) date to get data for (uses month and year)
     :return: (dict) api response json data dictionary
     """
+    # return the already-parsed month dict if it was loaded before,
+    # saves re-reading and re-parsing the json file on every lookup
+    cache_key = (cit, count, date.year, date.month)
+    if cache_key in MONTH_CACHE:
+        return MONTH_CACHE[cache_key]
+
     json_month_file = os.path.join(
         DATA_DIR, f"{date.year}-{date.month}-{cit}-{count}.json")
 
     if not os.path.exists(json_month_file):
         try:
-            res = requests.get(
-                API_ENDPOINT+f"?city={cit}&country={count}&month={date.month}&year={date.year}", timeout=300)
+            # prefer the coordinates endpoint when the location came from IP
+            # detection, it skips the city/country geocoding on the api side
+            coords = sg.user_settings_get_entry('-coords-')
+            if coords:
+                res = SESSION.get(
+                    COORDS_API_ENDPOINT+f"?latitude={coords[0]}&longitude={coords[1]}&month={date.month}&year={date.year}", timeout=300)
+            else:
+                res = SESSION.get(
+                    API_ENDPOINT+f"?city={cit}&country={count}&month={date.month}&year={date.year}", timeout=300)
         except:
             return "RequestError"
         if res.status_code != 200:  # if invalid city or country, return None instead of filename
             return None
 
-        with open(json_month_file, mode="w", encoding='utf-8') as f:
-            f.write(res.text)
+        with open(json_month_file, mode="wb") as f:
+            f.write(res.content)
 
-    with open(json_month_file, encoding='utf-8') as month_prayers:
-        month_data = json.load(month_prayers)
+    with open(json_month_file, mode="rb") as month_prayers:
+        # parse with orjson when available, it's much faster than stdlib json
+        # for the big nested month responses
+        if orjson:
+            month_data = orjson.loads(month_prayers.read())
+        else:
+            month_data = json.loads(month_prayers.read())
 
+    MONTH_CACHE[cache_key] = month_data
     return month_data
 
 
@@ -194,7 +324,9 @@ def get_main_layout_and_tomorrow_prayers(api_res: dict) -> tuple[list, dict]:
     """
     now = datetime.datetime.now()
     tomorrow = now+datetime.timedelta(days=1)
-    current_times = api_res["data"][now.day-1]["timings"]
+    # copy the timings dict before converting its values to datetimes below,
+    # api_res may come from MONTH_CACHE and the cached data must stay pristine
+    current_times = dict(api_res["data"][now.day-1]["timings"])
     global UPCOMING_PRAYERS
 
     ISHA_OBJ = current_times['Isha'].split()
@@ -202,7 +334,8 @@ def get_main_layout_and_tomorrow_prayers(api_res: dict) -> tuple[list, dict]:
     # Check if Isha passed as to get the following day timings
     # Prayer times change after Isha athan to the times of the following day
     # if NOW is after current Isha time
-    if datetime.datetime.now() > datetime.datetime.strptime(f"{ISHA_OBJ[0]} {now.day} {now.month} {now.year}", "%H:%M %d %m %Y"):
+    isha_hour, isha_min = ISHA_OBJ[0].split(":")
+    if datetime.datetime.now() > datetime.datetime(now.year, now.month, now.day, int(isha_hour), int(isha_min)):
         # replace all prayer times with the next day prayers
         if tomorrow.day < now.day:  # SPECIAL CASE: if today is the last day in the month, fetch new month calender
             api_res = fetch_calender_data(sg.user_settings_get_entry(
@@ -210,15 +343,20 @@ def get_main_layout_and_tomorrow_prayers(api_res: dict) -> tuple[list, dict]:
             if api_res == "RequestError":
                 sg.user_settings_delete_entry('-city-')
                 sg.user_settings_delete_entry('-country-')
+                if sg.user_settings_get_entry('-coords-'):
+                    sg.user_settings_delete_entry('-coords-')
                 sys.exit()
 
-            current_times = api_res["data"][tomorrow.day - 1]["timings"]
+            current_times = dict(api_res["data"][tomorrow.day - 1]["timings"])
             # remove last month data after setting up the new month json file
             os.remove(os.path.join(
                 DATA_DIR, f"{now.year}-{now.month}-{sg.user_settings_get_entry('-city-')}-{sg.user_settings_get_entry('-country-')}.json")
             )
+            MONTH_CACHE.pop((sg.user_settings_get_entry('-city-'),
+                             sg.user_settings_get_entry('-country-'),
+                             now.year, now.month), None)
         else:
-            current_times = api_res["data"][now.day]["timings"]
+            current_times = dict(api_res["data"][now.day]["timings"])
 
         ISHA_PASSED = True
 
@@ -226,9 +364,11 @@ def get_main_layout_and_tomorrow_prayers(api_res: dict) -> tuple[list, dict]:
     for k, v in current_times.items():
         # to adjust the day,month, year of the prayer datetime object
         date = tomorrow if ISHA_PASSED else now
-        t = v.split(" ")[0] + f" {date.day} {date.month} {date.year}"
-        current_times[k] = datetime.datetime.strptime(
-            t, "%H:%M %d %m %Y")
+        # build the datetime directly from the "HH:MM" prefix,
+        # much faster than formatting a string and running it through strptime
+        hh, mm = v.split(" ", 1)[0].split(":")
+        current_times[k] = datetime.datetime(
+            date.year, date.month, date.day, int(hh), int(mm))
 
     print(" DEBUG ".center(50, "="))
     initial_layout = [
@@ -253,7 +393,10 @@ def get_main_layout_and_tomorrow_prayers(api_res: dict) -> tuple[list, dict]:
 
             print(prayer, time)  # Debugging
             if now < time:  # adding upcoming prayers from the point of application start, this list will be modified as prayer times pass
-                UPCOMING_PRAYERS.append([prayer, time])
+                # the formatted time string never changes for a given prayer,
+                # compute it once here instead of on display
+                UPCOMING_PRAYERS.append(
+                    [prayer, time, time.strftime('%I:%M %p')])
 
     # the rest of the main window layout
     initial_layout += [[sg.HorizontalSeparator(color="dark brown")],
@@ -274,6 +417,7 @@ def start_system_tray(win: sg.Window):
     """starts the SystemTray object and instantiates it's menu and tooltip
     :return: (psgtray.SystemTray) systemtray object for application
     """
+    from psgtray import SystemTray
     menu = ['', ['Show Window', 'Hide Window', '---', 'Stop athan',
                  'Settings', 'Exit']]
     tray = SystemTray(menu=menu, tooltip="Next Prayer",
@@ -292,17 +436,29 @@ def display_main_window(main_win_layout, current_month_data) -> bool:
                        finalize=True)
 
     application_tray = start_system_tray(win=window)
+    # cache the saved settings in locals, sg.user_settings_get_entry re-reads
+    # the settings file on every call which is wasteful inside the event loop
+    city = sg.user_settings_get_entry('-city-')
+    country = sg.user_settings_get_entry('-country-')
+    mute_athan = sg.user_settings_get_entry('-mute-athan-')
+    athan_sound = sg.user_settings_get_entry('-athan_sound-')
     win2_active = False
     athan_play_obj = None
     end_of_month_hijri = None
+    last_displayed_now = None
+    last_displayed_minute = None
+    last_tooltip = ""
     global UPCOMING_PRAYERS
     global save_loc_check
+    global settings_window
     while True:
         now = datetime.datetime.now().replace(microsecond=0)
 
         if now >= UPCOMING_PRAYERS[0][1]:
             # remove current fard from list, update remaining time to be 0 before playing athan sound
             fard = UPCOMING_PRAYERS.pop(0)
+            # force the minute-cached widgets to repaint with the new next prayer
+            last_displayed_minute = None
 
             if fard[0] != "Sunrise":
                 application_tray.show_message(
@@ -310,7 +466,7 @@ def display_main_window(main_win_layout, current_month_data) -> bool:
 
             # play athan sound from user athan sound settings (if athan sound not muted)
                 try:
-                    if not sg.user_settings_get_entry('-mute-athan-'):
+                    if not mute_athan:
                         athan_play_obj = play_selected_athan()
                 except:
                     print(
@@ -318,43 +474,66 @@ def display_main_window(main_win_layout, current_month_data) -> bool:
             # If last prayer in list (Isha), then update the whole application with the next day prayers starting from Fajr
             if len(UPCOMING_PRAYERS) == 0:
                 new_data = get_main_layout_and_tomorrow_prayers(fetch_calender_data(
-                    sg.user_settings_get_entry('-city-'), sg.user_settings_get_entry('-country-'), date=now))
+                    city, country, date=now))
                 current_month_data = new_data[1]
                 del new_data
                 for prayer in UPCOMING_PRAYERS:
                     window[f'-{prayer[0].upper()} TIME-'].update(
-                        value=prayer[1].strftime("%I:%M %p"))
+                        value=prayer[2])
 
         # get remaining time till next prayer
         time_d = UPCOMING_PRAYERS[0][1] - now
 
-        # update the main window with the next prayer and remaining time
-        window['-NEXT PRAYER-'].update(
-            value=f'{UPCOMING_PRAYERS[0][0]}', font=GUI_FONT+" bold")
-        window['-TIME_D-'].update(value=f'{time_d}')
-        window['-CURRENT-TIME-'].update(value=now.strftime("%I:%M %p"))
-        # update the current dates
-        window['-TODAY-'].update(
-            value=now.date().strftime("%a %d %b %y"))
-
-        if now.month == UPCOMING_PRAYERS[0][1].month:
-            end_of_month_hijri = None
-            window['-TODAY_HIJRI-'].update(
-                value=get_hijri_date_from_json(now, api_res=current_month_data))
-
-        else:
-
-            if not end_of_month_hijri:
-                end_of_month_hijri = get_hijri_date_from_json(now, api_res=fetch_calender_data(
-                    sg.user_settings_get_entry('-city-'), sg.user_settings_get_entry('-country-'), now))
-
-            window['-TODAY_HIJRI-'].update(value=end_of_month_hijri)
-        # update system tray tooltip also
-        application_tray.set_tooltip(
-            f"Next prayer: {UPCOMING_PRAYERS[0][0]} in {time_d}")
+        # the displayed values only change once per second at most,
+        # skip the redundant widget writes on wakeups within the same second
+        if now != last_displayed_now:
+            last_displayed_now = now
+
+            window['-TIME_D-'].update(value=f'{time_d}')
+
+            # the rest of the displayed strings are minute-resolution,
+            # only run strftime and the widget writes when the minute changes
+            minute_key = (now.day, now.hour, now.minute)
+            if minute_key != last_displayed_minute:
+                last_displayed_minute = minute_key
+
+                # update the main window with the next prayer and remaining time
+                window['-NEXT PRAYER-'].update(
+                    value=f'{UPCOMING_PRAYERS[0][0]}', font=GUI_FONT+" bold")
+                window['-CURRENT-TIME-'].update(value=now.strftime("%I:%M %p"))
+                # update the current dates
+                window['-TODAY-'].update(
+                    value=now.date().strftime("%a %d %b %y"))
+
+                if now.month == UPCOMING_PRAYERS[0][1].month:
+                    end_of_month_hijri = None
+                    window['-TODAY_HIJRI-'].update(
+                        value=get_hijri_date_from_json(now, api_res=current_month_data))
+
+                else:
+
+                    if not end_of_month_hijri:
+                        end_of_month_hijri = get_hijri_date_from_json(now, api_res=fetch_calender_data(
+                            city, country, now))
+
+                    window['-TODAY_HIJRI-'].update(value=end_of_month_hijri)
+            # update system tray tooltip also, but only when the text actually
+            # changed, set_tooltip crosses into Tk/OS APIs on every call
+            new_tooltip = f"Next prayer: {UPCOMING_PRAYERS[0][0]} in {time_d}"
+            if new_tooltip != last_tooltip:
+                last_tooltip = new_tooltip
+                application_tray.set_tooltip(new_tooltip)
 
         # main event reading
-        event1, values1 = window.read(timeout=100)
+        # sleep until the clock needs repainting (~1s) or the next prayer is due,
+        # instead of waking 10 times a second; keep the short timeout while the
+        # settings window is open so its events stay responsive
+        if win2_active:
+            timeout_ms = 100
+        else:
+            timeout_ms = max(
+                200, min(1000, int((UPCOMING_PRAYERS[0][1] - now).total_seconds()*1000)))
+        event1, values1 = window.read(timeout=timeout_ms)
 
         if event1 == application_tray.key:
             event1 = values1[event1]
@@ -382,50 +561,68 @@ def display_main_window(main_win_layout, current_month_data) -> bool:
         # if clicked settings button, open up the settings window and read values from it along with the main window
         elif event1 in ("-SETTINGS-", "Settings") and not win2_active:
             win2_active = True
-            current_athan = sg.user_settings_get_entry(
-                '-athan_sound-').split('.')[0].replace("_", " ")
-            settings_layout = [[sg.Text("Mute athan"),
-                                sg.Push(),
-                                sg.Button(image_data=TOGGLE_ON_B64 if sg.user_settings_get_entry('-mute-athan-') else TOGGLE_OFF_B64,
-                                          key='-TOGGLE-MUTE-', button_color=(sg.theme_background_color(), sg.theme_background_color()),
-                                          border_width=0, metadata=sg.user_settings_get_entry('-mute-athan-'))],
-                               [sg.Text(f"Save location ({sg.user_settings_get_entry('-city-')}, {sg.user_settings_get_entry('-country-')})"),
-                                sg.Push(),
-                                sg.Button(image_data=TOGGLE_ON_B64 if save_loc_check else TOGGLE_OFF_B64,
-                                          key='-TOGGLE-GRAPHIC-', button_color=(sg.theme_background_color(), sg.theme_background_color()),
-                                          border_width=0, metadata=save_loc_check)],
-                               [sg.Text("Current Athan:", key="-DISPLAYED_MSG-"),
-                                sg.Push(),
-                                sg.Combo(enable_events=True, values=AVAILABLE_ADHANS, key="-DROPDOWN-ATHANS-", readonly=True, default_value=current_athan, font=BUTTON_FONT)],
-                               [sg.Button('Download next 12 months data', key='-GET-NEXT-12-MON-', font=BUTTON_FONT),
-                               sg.Text(key='-DOWN-12-MON-PROG-',
-                                       font="Segoe\ UI 8 bold"),
-                               sg.Push(),
-                               sg.Button("Done", key='-DONE-', font=BUTTON_FONT, pad=(5, 15))]]
-
-            settings_window = sg.Window("Athany - settings",
-                                        settings_layout,
-                                        icon=APP_ICON,
-                                        font=GUI_FONT,
-                                        keep_on_top=True)
+            current_athan = athan_sound.split('.')[0].replace("_", " ")
+            # build the settings window only once, then hide/un_hide it on subsequent opens
+            # to avoid recreating all the tkinter widgets every time
+            if settings_window is None:
+                settings_layout = [[sg.Text("Mute athan"),
+                                    sg.Push(),
+                                    sg.Button(image_data=TOGGLE_ON_B64 if mute_athan else TOGGLE_OFF_B64,
+                                              key='-TOGGLE-MUTE-', button_color=(sg.theme_background_color(), sg.theme_background_color()),
+                                              border_width=0, metadata=mute_athan)],
+                                   [sg.Text(f"Save location ({city}, {country})"),
+                                    sg.Push(),
+                                    sg.Button(image_data=TOGGLE_ON_B64 if save_loc_check else TOGGLE_OFF_B64,
+                                              key='-TOGGLE-GRAPHIC-', button_color=(sg.theme_background_color(), sg.theme_background_color()),
+                                              border_width=0, metadata=save_loc_check)],
+                                   [sg.Text("Current Athan:", key="-DISPLAYED_MSG-"),
+                                    sg.Push(),
+                                    sg.Combo(enable_events=True, values=AVAILABLE_ADHANS, key="-DROPDOWN-ATHANS-", readonly=True, default_value=current_athan, font=BUTTON_FONT)],
+                                   [sg.Button('Download next 12 months data', key='-GET-NEXT-12-MON-', font=BUTTON_FONT),
+                                   sg.Text(key='-DOWN-12-MON-PROG-',
+                                           font="Segoe\ UI 8 bold"),
+                                   sg.Push(),
+                                   sg.Button("Done", key='-DONE-', font=BUTTON_FONT, pad=(5, 15))]]
+
+                settings_window = sg.Window("Athany - settings",
+                                            settings_layout,
+                                            icon=APP_ICON,
+                                            font=GUI_FONT,
+                                            keep_on_top=True,
+                                            enable_close_attempted_event=True)
+            else:
+                # refresh the dynamic fields before showing the cached window again
+                settings_window['-DISPLAYED_MSG-'].update(
+                    value="Current Athan:")
+                settings_window['-DROPDOWN-ATHANS-'].update(
+                    value=current_athan)
+                settings_window['-DOWN-12-MON-PROG-'].update(value="")
+                settings_window['-TOGGLE-MUTE-'].metadata = mute_athan
+                settings_window['-TOGGLE-MUTE-'].update(
+                    image_data=TOGGLE_ON_B64 if settings_window['-TOGGLE-MUTE-'].metadata else TOGGLE_OFF_B64)
+                settings_window['-TOGGLE-GRAPHIC-'].metadata = save_loc_check
+                settings_window['-TOGGLE-GRAPHIC-'].update(
+                    image_data=TOGGLE_ON_B64 if save_loc_check else TOGGLE_OFF_B64)
+                settings_window.un_hide()
+                settings_window.bring_to_front()
 
         # If 2nd window (settings window) is open, read values from it
         if win2_active:
             event2, values2 = settings_window.read(timeout=100)
-            if event2 in (sg.WIN_CLOSED, "-DONE-"):
+            if event2 in (sg.WIN_CLOSED, sg.WIN_CLOSE_ATTEMPTED_EVENT, "-DONE-"):
                 win2_active = False
                 save_loc_check = settings_window['-TOGGLE-GRAPHIC-'].metadata
-                settings_window.close()
+                # keep the window around hidden so reopening settings is instant
+                settings_window.hide()
 
             elif event2 == "-DROPDOWN-ATHANS-" and values2["-DROPDOWN-ATHANS-"] in AVAILABLE_ADHANS:
-                # get a list of all athans currently in folder as user might have downloaded before
-                DOWNLOADED_ATHANS = os.listdir(ATHANS_DIR)
                 # convert option into filename
                 choosen_athan = f"{values2['-DROPDOWN-ATHANS-'].replace(' ', '_')}.wav"
 
                 if choosen_athan in DOWNLOADED_ATHANS:  # athan is already in Athans directory
-                    sg.user_settings_set_entry('-athan_sound-',
-                                               value=choosen_athan)
+                    athan_sound = choosen_athan
+                    queue_settings_write('-athan_sound-',
+                                         value=choosen_athan)
                     if athan_play_obj:
                         athan_play_obj.stop()
                     athan_play_obj = play_selected_athan()
@@ -441,8 +638,10 @@ def display_main_window(main_win_layout, current_month_data) -> bool:
                     # run the download function to get athan from archive
                     downloaded = download_athan(choosen_athan)
                     if downloaded:  # if all went well, set as new athan and play audio
-                        sg.user_settings_set_entry('-athan_sound-',
-                                                   value=choosen_athan)
+                        DOWNLOADED_ATHANS.add(choosen_athan)
+                        athan_sound = choosen_athan
+                        queue_settings_write('-athan_sound-',
+                                             value=choosen_athan)
                         settings_window['-DISPLAYED_MSG-'].update(
                             value='Current Athan:')
                         settings_window.refresh()
@@ -459,25 +658,36 @@ def display_main_window(main_win_layout, current_month_data) -> bool:
                             title="Download Failed", message="Couldn't download athan file, check your internet connection and try again")
 
                 # Debugging
-                print("[DEBUG] Current athan:",
-                      sg.user_settings_get_entry("-athan_sound-"))
+                print("[DEBUG] Current athan:", athan_sound)
 
             elif event2 == '-GET-NEXT-12-MON-':
-                download_year = now.year
+                # figure out which of the next 12 months aren't cached on
+                # disk yet, then fetch only the missing ones in parallel
+                missing_dates = []
                 for mon_d in range(1, 13):
-                    download_mon = (mon_d + now.month) % 12
-                    if download_mon == 0:
-                        download_mon = 12
-                    elif download_mon <= now.month:
-                        download_year = now.year+1
+                    download_mon = (now.month + mon_d - 1) % 12 + 1
+                    download_year = now.year + (now.month + mon_d - 1) // 12
+                    if not os.path.exists(os.path.join(
+                            DATA_DIR, f"{download_year}-{download_mon}-{city}-{country}.json")):
+                        missing_dates.append(datetime.datetime(
+                            day=1, month=download_mon, year=download_year))
+
+                if missing_dates:
+                    done = 0
                     settings_window['-DOWN-12-MON-PROG-'].update(
-                        value=f'Downloading month {download_mon}-{download_year} data...')
+                        value=f'{done}/{len(missing_dates)} months downloaded')
                     settings_window.refresh()
-                    fetch_calender_data(sg.user_settings_get_entry('-city-'),
-                                        sg.user_settings_get_entry(
-                                            '-country-'),
-                                        datetime.datetime(day=1, month=download_mon, year=download_year))
-                    mon_d += 1
+                    with concurrent.futures.ThreadPoolExecutor(max_workers=6) as executor:
+                        download_futures = [executor.submit(fetch_calender_data,
+                                                            city,
+                                                            country,
+                                                            download_date)
+                                            for download_date in missing_dates]
+                        for future in concurrent.futures.as_completed(download_futures):
+                            done += 1
+                            settings_window['-DOWN-12-MON-PROG-'].update(
+                                value=f'{done}/{len(missing_dates)} months downloaded')
+                            settings_window.refresh()
                 settings_window['-DOWN-12-MON-PROG-'].update(value='All set!')
 
             elif event2 == "-TOGGLE-GRAPHIC-":
@@ -489,10 +699,17 @@ def display_main_window(main_win_layout, current_month_data) -> bool:
                 settings_window['-TOGGLE-MUTE-'].metadata = not settings_window['-TOGGLE-MUTE-'].metadata
                 settings_window['-TOGGLE-MUTE-'].update(
                     image_data=TOGGLE_ON_B64 if settings_window['-TOGGLE-MUTE-'].metadata else TOGGLE_OFF_B64)
-                sg.user_settings_set_entry("-mute-athan-",
-                                           value=settings_window['-TOGGLE-MUTE-'].metadata)
-    # close application on exit
+                mute_athan = settings_window['-TOGGLE-MUTE-'].metadata
+                queue_settings_write("-mute-athan-",
+                                     value=mute_athan)
+    # close application on exit, stopping the background writer first so the
+    # final flush and any settings cleanup can't race it on the file
+    stop_settings_writer()
+    flush_settings_writes()
     application_tray.close()
+    if settings_window is not None:
+        settings_window.close()
+        settings_window = None
     window.close()
     del application_tray
     del window
@@ -522,6 +739,7 @@ if sg.user_settings_get_entry('-city-') is None and sg.user_settings_get_entry('
 
     while True:
         m_data = False
+        used_auto_location = False
         event, values = choose_location.read()
 
         if event in (sg.WIN_CLOSED, "-CANCEL-"):
@@ -562,6 +780,7 @@ if sg.user_settings_get_entry('-city-') is None and sg.user_settings_get_entry('
 
                 city = location_api[0]
                 country = location_api[1]
+                used_auto_location = True
 
                 choose_location['-LOC TXT-'].update(
                     value=f'Fetching prayer times for {city},{country}...')
@@ -581,6 +800,11 @@ if sg.user_settings_get_entry('-city-') is None and sg.user_settings_get_entry('
                                            city)
                 sg.user_settings_set_entry('-country-',
                                            country)
+                # save the detected coordinates so later month fetches can
+                # use the lat/lon calendar endpoint
+                if used_auto_location and location_coords:
+                    sg.user_settings_set_entry('-coords-',
+                                               value=location_coords)
 
                 save_loc_check = values['-SAVE_LOC_CHECK-']
 
@@ -611,3 +835,5 @@ except KeyboardInterrupt:
 if not save_loc_check and sg.user_settings_get_entry('-city-') and sg.user_settings_get_entry('-country-'):
     sg.user_settings_delete_entry('-city-')
     sg.user_settings_delete_entry('-country-')
+    if sg.user_settings_get_entry('-coords-'):
+        sg.user_settings_delete_entry('-coords-')